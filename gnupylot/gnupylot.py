@@ -1,11 +1,53 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import array
+import atexit
+import io
+import os
+import selectors
 import subprocess as sub
+import sys
+import threading
+import time
 import tempfile as tmp
+from collections import OrderedDict, deque
+from itertools import chain
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 class Figure(object):
 
+    # Temporary data files are recycled across figures instead of creating a
+    # new file for every plot
+    _free_files = []
+    _retired_files = []
+    _max_free_files = 16
+
+    # Writes to the gnuplot pipe are batched up to the pipe page size
+    _write_batch_size = 4096
+    _max_queued_bytes = 4 * 1024 * 1024
+
+    _sync_sentinel = b"__gnupylot_ready__"
+    _sync_timeout = 60
+
+    # Spawning gnuplot is costly, so processes of closed figures are kept for
+    # new figures
+    _idle_processes = []
+    _max_idle_processes = 4
+    # Processes whose terminal opened a window are quit instead, as gnuplot
+    # keeps the window open until it exits
+    _window_terminals = {"qt", "wxt", "x11", "windows", "aqua"}
+
+    # Cached ASCII blocks and their values are bounded by total size
+    _format_cache_max_bytes = 16 * 1024 * 1024
+    _format_cache_max_entry_bytes = 4 * 1024 * 1024
+    _format_cache_min_rows = 512
+    _row_formats = {}
+
     def __init__(self, verbose=False, replot=False, interactive=True):
         """
         Parameters
@@ -19,14 +61,44 @@ class Figure(object):
             If set to False, script execution will not pause after showing a figure.
         """
         
-        self.command = b""
-        self._process = sub.Popen(
-            ["gnuplot"], 
-            stdin=sub.PIPE, 
-            # stdout=sub.PIPE, 
-            # stderr=sub.PIPE
-        )
+        self._pending = bytearray()
+        self._outgoing = deque()
+        self._queued = 0
+
+        # gnuplot processes of closed figures are reused when available
+        self._process = None
+        while Figure._idle_processes and self._process is None:
+            process, synced, status = Figure._idle_processes.pop()
+            if process.poll() is None:
+                self._process, self._synced, self._status = process, synced, status
+            else:
+                process.stdin.close()
+        if self._process is None:
+            self._process = sub.Popen(
+                ["gnuplot"], 
+                stdin=sub.PIPE, 
+                # stdout=sub.PIPE, 
+                stderr=sub.PIPE,
+                bufsize=0,
+            )
+            self._synced = threading.Event()
+            self._status = {"terminal": None}
+            threading.Thread(
+                target=Figure._read_errors, 
+                args=(self._process, self._synced, self._status), 
+                daemon=True
+            ).start()
+            # Pipes can only be waited on with selectors on POSIX systems, writes
+            # simply block elsewhere
+            if os.name == "posix": os.set_blocking(self._process.stdin.fileno(), False)
+            # Saves the startup terminal, restored when the process is reused
+            self._write(b"set term push\n")
+
         self._data_files = []
+        self._stale_files = []
+        self._inline_data = []
+        self._format_cache = OrderedDict()
+        self._format_cache_bytes = 0
         self._replot_active = False
 
         self.verbose = verbose
@@ -37,19 +109,96 @@ class Figure(object):
         """
         Shows the current figure.
 
-        Flushes the gnuplot process pipe and then waits for user input
-        (i.e., script execution is paused) if interactive was set to True
-        when the Figure object was created.
+        Flushes the gnuplot process pipe, waits for gnuplot to process all
+        commands sent so far, and then waits for user input (i.e., script
+        execution is paused) if interactive was set to True when the Figure
+        object was created. Raises TimeoutError if gnuplot does not catch up
+        within Figure._sync_timeout seconds (e.g. when stuck in a "pause").
         """
-        if self.verbose: print(self.command)
-        self._process.stdin.write(self.command)
-        self._process.stdin.flush()
-        if self.interactive: input()
+        self._flush(wait=True)
+        self._sync()
+        if self.interactive: sys.stdin.readline()
+
+    def _sync(self):
+        # gnuplot prints the sentinel, followed by the current terminal, once
+        # it has processed everything before it. printerr always writes to
+        # stderr, whatever "set print" says. The leading newline ends any
+        # unterminated line left over, e.g. by data gnuplot failed to read.
+        self._synced.clear()
+        self._write(b"\nprinterr '" + Figure._sync_sentinel + b"', GPVAL_TERM\n")
+        self._flush(wait=True)
+        deadline = time.monotonic() + Figure._sync_timeout
+        while not self._synced.wait(0.1):
+            if self._process.poll() is not None: break
+            if time.monotonic() > deadline:
+                raise TimeoutError("gnuplot did not process the commands in time")
+
+        # gnuplot has read the files of superseded plots by now
+        Figure._recycle_data_files(self._stale_files)
+        self._stale_files = []
+
+    @staticmethod
+    def _read_errors(process, synced, status):
+        # gnuplot's error output is forwarded to ours, except for the sentinel
+        # lines printed by _sync()
+        with io.BufferedReader(process.stderr) as errors:
+            for line in errors:
+                words = line.split()
+                if words and words[0] == Figure._sync_sentinel:
+                    status["terminal"] = b" ".join(words[1:]).decode()
+                    synced.set()
+                else:
+                    sys.stderr.write(line.decode(errors="replace"))
+                    sys.stderr.flush()
+        # Never leave _sync() waiting on a process that has exited
+        synced.set()
 
     def _command(self, command):
         if not isinstance(command, str): raise TypeError()
-        if self.verbose: print(command)
-        self.command += command.encode() + b"\n"
+        self._write_line(command.encode())
+
+    def _write_line(self, line):
+        if self.verbose: print(line.decode())
+        self._write(line + b"\n")
+
+    def _write(self, data):
+        # Large data blocks bypass the batch buffer to avoid copying them
+        if len(data) >= Figure._write_batch_size:
+            self._flush()
+            self._outgoing.append(memoryview(data))
+            self._queued += len(data)
+            self._drain()
+            return
+        self._pending += data
+        if len(self._pending) >= Figure._write_batch_size: self._flush()
+
+    def _flush(self, wait=False):
+        if self._pending:
+            self._outgoing.append(memoryview(self._pending))
+            self._queued += len(self._pending)
+            self._pending = bytearray()
+        self._drain(wait)
+
+    def _drain(self, wait=False):
+        # The pipe is non-blocking: only what gnuplot can take right now is
+        # written and the rest stays queued, so that Python can prepare the
+        # next commands while gnuplot reads the previous ones. Past a few MB
+        # queued, this waits for gnuplot to catch up instead.
+        if self._queued > Figure._max_queued_bytes: wait = True
+        while self._outgoing:
+            view = self._outgoing[0]
+            written = self._process.stdin.write(view)
+            if written is None:
+                if not wait: return
+                with selectors.DefaultSelector() as selector:
+                    selector.register(self._process.stdin, selectors.EVENT_WRITE)
+                    selector.select()
+            else:
+                self._queued -= written
+                if written < len(view):
+                    self._outgoing[0] = view[written:]
+                else:
+                    self._outgoing.popleft()
 
     def set(self, setting):
         """
@@ -60,7 +209,7 @@ class Figure(object):
         setting : str
             The setting string to send to gnuplot, e.g. "term dumb", "xlabel 'x'", etc.
         """
-        self._command("set " + setting)
+        self._write_line(b"set " + setting.encode())
 
     def unset(self, setting):
         """
@@ -71,7 +220,7 @@ class Figure(object):
         setting : str
             The setting string to send to gnuplot, e.g. "border", "tics", "key", etc.
         """
-        self._command("unset " + setting)
+        self._write_line(b"unset " + setting.encode())
 
     def command(self, command):
         """
@@ -84,19 +233,115 @@ class Figure(object):
         """
         self._command(command)
 
+    @staticmethod
+    def _recycle_data_files(files):
+        for file in files:
+            if len(Figure._free_files) < Figure._max_free_files:
+                Figure._free_files.append(file)
+            else:
+                file.close()
+
+    def _supersede_data_files(self):
+        # A new plot no longer references the data files of the previous one,
+        # but gnuplot might not have read them yet
+        self._stale_files += self._data_files
+        self._data_files = []
+
+    def _data_file(self):
+        # Stale files are only recycled after a sync, forced here if too many
+        # of them pile up (e.g. in an animation loop)
+        if len(self._stale_files) >= Figure._max_free_files: self._sync()
+
+        # Files of a closed figure are only reused once its gnuplot process has
+        # exited, as gnuplot might otherwise still be reading them
+        retired_files = []
+        for process, files in Figure._retired_files:
+            if process.poll() is None:
+                retired_files.append((process, files))
+            else:
+                Figure._recycle_data_files(files)
+        Figure._retired_files = retired_files
+
+        if Figure._free_files:
+            data_file = Figure._free_files.pop()
+            data_file.seek(0)
+            data_file.truncate(0)
+        else:
+            data_file = tmp.NamedTemporaryFile()
+        self._data_files.append(data_file)
+        return data_file
+
+    def _format(self, args):
+        # Formatting in Python is slow, so large blocks are cached in case the
+        # same data is plotted again (e.g. a fixed reference curve). Values are
+        # compared as packed doubles, which is all the formatting depends on.
+        key = None
+        if len(args[0]) >= Figure._format_cache_min_rows:
+            values = array.array("d", chain.from_iterable(args)).tobytes()
+            key = (len(args), hash(values))
+            cached = self._format_cache.get(key)
+            if cached is not None and cached[0] == values:
+                self._format_cache.move_to_end(key)
+                return cached[1]
+
+        # Rows are formatted with a single format string specialized for the
+        # number of columns, then encoded once for the whole block
+        row_format = Figure._row_formats.get(len(args))
+        if row_format is None:
+            row_format = " ".join(["%.17g"] * len(args)) + "\n"
+            Figure._row_formats[len(args)] = row_format
+        block = "".join([row_format % row for row in zip(*args)]).encode()
+
+        if key is not None:
+            size = len(values) + len(block)
+            if size <= Figure._format_cache_max_entry_bytes:
+                if key in self._format_cache:
+                    self._format_cache_bytes -= sum(map(len, self._format_cache.pop(key)))
+                self._format_cache[key] = (values, block)
+                self._format_cache_bytes += size
+                while self._format_cache_bytes > Figure._format_cache_max_bytes:
+                    _, evicted = self._format_cache.popitem(last=False)
+                    self._format_cache_bytes -= sum(map(len, evicted))
+        return block
+
     def _save(self, *args):
-        self._data_files.append(tmp.NamedTemporaryFile())
-        len_arg0 = len(args[0])
-        for arg in args: 
-            if len(arg) != len_arg0: raise ValueError()
-        for row in range(len_arg0):
-            for arg in args:
-                self._data_files[-1].write((f"{arg[row]:23.16e} ").encode())
-            self._data_files[-1].write(b"\n")
-        
-        # print(self._data_files[-1].read())
-        self._data_files[-1].flush()
-        return self._data_files[-1].name
+        if len({len(arg) for arg in args}) != 1: raise ValueError()
+
+        # Whenever possible, data is dumped as raw native doubles, which gnuplot
+        # reads directly through its binary data format. The buffer is handed
+        # over as a memoryview, so its bytes are only copied by the kernel.
+        binary_options = f" binary record={len(args[0])} format='{'%float64' * len(args)}'"
+        if np is not None:
+            data = np.column_stack([np.asarray(arg, dtype=np.float64) for arg in args])
+            block = memoryview(data.reshape(-1).view(np.uint8))
+            options = binary_options
+        elif all(isinstance(arg, (array.array, memoryview)) for arg in args):
+            # Typed buffers can still be sent in binary without numpy. Interleaving
+            # still creates a float object per value, the gain is skipping the
+            # ASCII formatting on our side and the parsing on gnuplot's
+            block = memoryview(array.array("d", chain.from_iterable(zip(*args)))).cast("B")
+            options = binary_options
+        else:
+            block = self._format(args)
+            options = ""
+
+        # ASCII data is sent inline after the plot command, terminated by an "e"
+        # line, unless subsequent replots need to read it again. Binary data
+        # always goes through a file: if gnuplot rejected the plot command, an
+        # inline binary block would be parsed as commands.
+        if not options and not self.replot:
+            self._inline_data.append(block + b"e\n")
+            return "'-'"
+
+        data_file = self._data_file()
+        data_file.write(block)
+        data_file.flush()
+        return f"'{data_file.name}'" + options
+
+    def _send_inline_data(self):
+        for block in self._inline_data:
+            self._write(block)
+        self._inline_data = []
 
     def plot(self, x, y=None, *args, **kwargs):
         """
@@ -119,43 +364,43 @@ class Figure(object):
         -------
         None
         """
-        command = ""
+        parts = []
 
         if self.replot and self._replot_active:
-            command += "replot "
+            parts.append("replot")
         else:
-            command += "plot "
+            parts.append("plot")
+            self._supersede_data_files()
 
         # Check if x is a string command or array-like
         if x is None: raise ValueError()
         x_array_like = False
         if isinstance(x, str):
-            command += x + " "
+            parts.append(x)
         else:
             x_array_like = True
 
         # Check if y is array-like depending on what x is
         if x_array_like:
             if y is not None:
-                data_file_name = self._save(x, y)
-                command += f"'{data_file_name}' "
+                parts.append(self._save(x, y))
             elif args[0] is not None:
-                data_file_name = self._save(x, args[0])
-                command += f"'{data_file_name}' "
-                args = tuple(args[i] for i in range(1, len(args)))
+                parts.append(self._save(x, args[0]))
+                args = args[1:]
             else:
                 raise ValueError()
 
         # Set unamed args
         for arg in args:
-            command += f"{arg} "
+            parts.append(f"{arg}")
 
         # Set named args
         for key,value in kwargs.items():
-            command += f"{key} {value} "
+            parts.append(f"{key} {value}")
 
         # Send command
-        self._command(command)
+        self._command(" ".join(parts))
+        self._send_inline_data()
         self._replot_active = True
 
     def splot(self, x, y=None, z=None, *args, **kwargs):
@@ -176,69 +421,116 @@ class Figure(object):
         **kwargs : str, optional
             Additional string arguments to send to gnuplot.
         """
-        command = ""
+        parts = []
 
         if self.replot and self._replot_active:
-            command += "replot "
+            parts.append("replot")
         else:
-            command += "splot "
+            parts.append("splot")
+            self._supersede_data_files()
 
         # Check if x is a string command or array-like
         if x is None: raise ValueError()
         x_array_like = False
         if isinstance(x, str):
-            command += x + " "
+            parts.append(x)
         else:
             x_array_like = True
 
         # Check if y is array-like depending on what x is
         if x_array_like:
             if y is not None and z is not None:
-                data_file_name = self._save(x, y)
-                command += f"'{data_file_name}' "
+                parts.append(self._save(x, y, z))
             elif args[0] is not None and args[1] is not None:
-                data_file_name = self._save(x, args[0])
-                command += f"'{data_file_name}' "
-                args = tuple(args[i] for i in range(2, len(args)))
+                parts.append(self._save(x, args[0], args[1]))
+                args = args[2:]
             else:
                 raise ValueError()
 
         # Set unamed args
         for arg in args:
-            command += f"{arg} "
+            parts.append(f"{arg}")
 
         # Set named args
         for key,value in kwargs.items():
-            command += f"{key} {value} "
+            parts.append(f"{key} {value}")
 
         # Send command
-        self._command(command)
+        self._command(" ".join(parts))
+        self._send_inline_data()
         self._replot_active = True
 
     def __enter__(self):
         return self
 
-    def _close_data_files(self):
-        for file in self._data_files: file.close()
+    def _release_data_files(self, synced):
+        files = self._stale_files + self._data_files
+        if synced:
+            Figure._recycle_data_files(files)
+        else:
+            Figure._retired_files.append((self._process, files))
+        self._stale_files = []
+        self._data_files = []
 
     def close(self):
         """
-        Closes the gnuplot process and associated temporary data files.
-
-        Does not block until process terminates, but instead returns immediately.
+        Closes the figure and releases its temporary data files for reuse.
+
+        This blocks until gnuplot has processed all commands. If the figure
+        was drawn to a file or a terminal without a window, and fewer than
+        Figure._max_idle_processes processes are idle, the gnuplot process is
+        then reset and kept for a future figure. Otherwise it is terminated,
+        which closes its window. Closing an already closed figure does
+        nothing.
         """
-        self._close_data_files()
-
-        # Necessary to ask gnuplot directly to quit, else the window might stay opened
-        # even after SIGTERM/SIGKILL is sent
-        self._process.stdin.write("q\n")
-        self._process.stdin.flush()
+        if self._process is None: return
+
+        if self._process.poll() is None:
+            responsive = True
+            try:
+                self._sync()
+                reusable = (self._process.poll() is None
+                    and self._status["terminal"] not in Figure._window_terminals
+                    and len(Figure._idle_processes) < Figure._max_idle_processes
+                    and all(process is not self._process for process, _, _ in Figure._idle_processes))
+                if reusable:
+                    # reset session clears variables and functions, reset clears
+                    # settings, and the terminal and output are restored separately
+                    self._write(b"unset output\nset term pop\nset term push\nreset session\nreset\n")
+                    self._sync()
+                    reusable = self._process.poll() is None
+            except TimeoutError:
+                # An unresponsive process (e.g. stuck in "pause") is not reused
+                responsive = reusable = False
+            if reusable:
+                Figure._idle_processes.append((self._process, self._synced, self._status))
+                self._release_data_files(synced=True)
+                self._process = None
+                return
+
+            # Necessary to ask gnuplot directly to quit, else the window might stay opened
+            # even after SIGTERM/SIGKILL is sent
+            self._write(b"q\n")
+            self._flush(wait=responsive)
         
+        self._process.stdin.close()
         self._process.terminate()
+        self._release_data_files(synced=False)
+        self._process = None
+
+    @staticmethod
+    def _close_idle_processes():
+        for process, _, _ in Figure._idle_processes:
+            if process.poll() is None: process.stdin.write(b"q\n")
+            process.stdin.close()
+            process.terminate()
+        Figure._idle_processes = []
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
         self.close()
 
+atexit.register(Figure._close_idle_processes)
+
 
 def show(*args, interactive=True):
     """
@@ -253,9 +545,9 @@ def show(*args, interactive=True):
         all figures.
     """
     for fig in args:
-        fig._process.stdin.write(fig.command)
-        fig._process.stdin.flush()
-    if interactive: input()
+        fig._flush(wait=True)
+        fig._sync()
+    if interactive: sys.stdin.readline()
 
 if __name__ == "__main__":
     with Figure() as fig: